@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Request, HTTPException, Depends
+from fastapi import FastAPI, Request, Response, HTTPException, Depends
 from fastapi.responses import JSONResponse
 import time
 import asyncio
@@ -31,7 +31,7 @@ async def shutdown_event():
     """Cleanup on shutdown"""
     await rate_limiter.close()
 
-async def check_rate_limit(request: Request):
+async def check_rate_limit(request: Request, response: Response):
     """Dependency to check rate limits"""
     client_id = request.client.host
     endpoint = request.url.path
@@ -56,21 +56,10 @@ async def check_rate_limit(request: Request):
             }
         )
     
-    # Add rate limit headers to response
-    request.state.rate_limit_info = info
-
-@app.middleware("http")
-async def add_rate_limit_headers(request: Request, call_next):
-    """Add rate limit headers to all responses"""
-    response = await call_next(request)
-    
-    if hasattr(request.state, "rate_limit_info"):
-        info = request.state.rate_limit_info
-        response.headers["X-RateLimit-Limit"] = str(info["current_limit"])
-        response.headers["X-RateLimit-Remaining"] = str(info["remaining"])
-        response.headers["X-RateLimit-Reset"] = str(info["reset_in"])
-    
-    return response
+    # Add rate limit headers to response (FastAPI merges them into the route's response)
+    response.headers["X-RateLimit-Limit"] = str(info["current_limit"])
+    response.headers["X-RateLimit-Remaining"] = str(info["remaining"])
+    response.headers["X-RateLimit-Reset"] = str(info["reset_in"])
 
 # ==================== API Endpoints ====================
 
@@ -163,5 +152,7 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
-        log_level="info"
+        log_level="info",
+        loop="uvloop",
+        http="httptools"
     )
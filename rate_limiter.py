@@ -1,17 +1,236 @@
 import redis.asyncio as redis
-from datetime import datetime, timedelta
 import json
 import numpy as np
 from sklearn.ensemble import IsolationForest
+from numba import njit
 import pickle
 import asyncio
+import random
 from typing import Dict, Tuple, List, Optional
 import logging
 from collections import defaultdict
 
+# Optional GPU backend: cuML's Isolation Forest trains all trees in
+# parallel on the device when CUDA is available
+try:
+    import cupy
+    from cuml.ensemble import IsolationForest as cuIsolationForest
+except ImportError:
+    cupy = None
+    cuIsolationForest = None
+
+# Optional compiled inference: Treelite walks the fitted trees in native
+# code, far cheaper than sklearn's per-call overhead on one-row inputs
+try:
+    import treelite
+    import treelite.gtil
+except ImportError:
+    treelite = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Atomically counts the request against its window and makes the
+# allow/deny decision, so the hot path costs a single round-trip with no
+# check-then-act race between workers.
+# The endpoint's (base, anomalous) limits come from the caller's limit
+# table in ARGV.
+# New window keys are recorded in the client's `client_windows:{client_id}`
+# sorted set, scored by window index, so they can be reset without scanning
+# the keyspace. Entries for windows whose keys have expired (older than two
+# windows back, given the 2-window TTL) are trimmed on each insert.
+# KEYS: [window_key, client_windows_key]
+# ARGV: [is_anomalous, window_ttl, base_limit, anomalous_limit,
+#        window_seconds, now]
+# Returns: {allowed, remaining, reset_in, count, limit}
+CHECK_REQUEST_SCRIPT = """
+local limit = tonumber(ARGV[3])
+if ARGV[1] == '1' then
+    limit = tonumber(ARGV[4])
+end
+
+local window = tonumber(ARGV[5])
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    local window_index = math.floor(tonumber(ARGV[6]) / window)
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    redis.call('ZADD', KEYS[2], window_index, KEYS[1])
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', '(' .. (window_index - 2))
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+
+local allowed = 0
+if count <= limit then
+    allowed = 1
+end
+local reset_in = window - (tonumber(ARGV[6]) % window)
+return {allowed, math.max(0, limit - count), reset_in, count, limit}
+"""
+
+
+def _gpu_available() -> bool:
+    """Check whether the cuML backend can be used"""
+    if cuIsolationForest is None:
+        return False
+    try:
+        return cupy.cuda.runtime.getDeviceCount() > 0
+    except cupy.cuda.runtime.CUDARuntimeError:
+        return False
+
+
+@njit(cache=True, fastmath=True)
+def _feat_kernel(timestamps, endpoints, counts, start, out):
+    """
+    Fill `out` with the features of requests `start..N-1` of a time-ordered
+    run of one client's requests. Row i only looks at requests up to and
+    including i.
+    """
+    n = timestamps.shape[0]
+    for i in range(start, n):
+        row = out[i - start]
+        t = timestamps[i]
+        row[0] = (t // 3600) % 24  # Hour of day
+        row[1] = (t // 86400 + 3) % 7  # Day of week (1970-01-01 was a Thursday)
+        row[2] = counts[i]  # Request count
+        row[3] = endpoints[i]  # Endpoint id
+        
+        # Mean/std of the intervals between the last 10 requests
+        lo = max(i - 9, 0)
+        k = i - lo
+        if k > 0:
+            mean = (t - timestamps[lo]) / k
+            var = 0.0
+            for j in range(lo + 1, i + 1):
+                d = timestamps[j] - timestamps[j - 1] - mean
+                var += d * d
+            row[4] = mean
+            row[5] = np.sqrt(var / k)
+        else:
+            row[4] = 0.0
+            row[5] = 0.0
+
+
+@njit(cache=True, fastmath=True)
+def _normalize_kernel(X, mean, std):
+    """Standardize X column-wise in place with the stored scaler"""
+    for i in range(X.shape[0]):
+        for j in range(X.shape[1]):
+            X[i, j] = (X[i, j] - mean[j]) / (std[j] + 1e-8)
+
+
+def _warm_kernels():
+    """Compile the numeric kernels up front so no request pays the JIT cost"""
+    features = np.empty((1, 6), dtype=np.float32)
+    _feat_kernel(
+        np.zeros(1, dtype=np.float64),
+        np.zeros(1, dtype=np.int16),
+        np.ones(1, dtype=np.int64),
+        0,
+        features
+    )
+    _normalize_kernel(features, np.zeros(6), np.ones(6))
+
+
+class ClientRing:
+    """
+    Fixed-capacity FIFO of a client's recent requests, stored as packed
+    arrays (timestamps + endpoint ids) instead of a list of dicts.
+    Backing storage starts small and doubles up to twice the capacity, so
+    one-off clients stay cheap; the live window is always a contiguous,
+    time-ordered slice and is compacted when the end is hit.
+    """
+    
+    __slots__ = ("capacity", "timestamps", "endpoints", "head", "n")
+    
+    initial_size = 16
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        size = min(self.initial_size, 2 * capacity)
+        self.timestamps = np.empty(size, dtype=np.float64)
+        self.endpoints = np.empty(size, dtype=np.int16)
+        self.head = 0
+        self.n = 0
+    
+    def __len__(self) -> int:
+        return self.n
+    
+    @property
+    def live_timestamps(self) -> np.ndarray:
+        return self.timestamps[self.head:self.head + self.n]
+    
+    @property
+    def live_endpoints(self) -> np.ndarray:
+        return self.endpoints[self.head:self.head + self.n]
+    
+    def append(self, timestamp: float, endpoint_id: int):
+        """Record a request, evicting the oldest one when full"""
+        end = self.head + self.n
+        size = len(self.timestamps)
+        if end == size and size < 2 * self.capacity:
+            # Grow the storage, moving the live window to its start
+            size = min(2 * size, 2 * self.capacity)
+            timestamps = np.empty(size, dtype=np.float64)
+            endpoints = np.empty(size, dtype=np.int16)
+            timestamps[:self.n] = self.timestamps[self.head:end]
+            endpoints[:self.n] = self.endpoints[self.head:end]
+            self.timestamps, self.endpoints = timestamps, endpoints
+            self.head = 0
+            end = self.n
+        elif end == size:
+            # Compact the live window back to the start of the storage
+            self.timestamps[:self.n] = self.timestamps[self.head:end]
+            self.endpoints[:self.n] = self.endpoints[self.head:end]
+            self.head = 0
+            end = self.n
+        
+        self.timestamps[end] = timestamp
+        self.endpoints[end] = endpoint_id
+        
+        if self.n == self.capacity:
+            self.head += 1
+        else:
+            self.n += 1
+    
+    def drop_until(self, cutoff: float):
+        """Drop all requests at or before `cutoff`"""
+        if not self.n or self.timestamps[self.head] > cutoff:
+            return  # Nothing has expired
+        if self.timestamps[self.head + self.n - 1] <= cutoff:
+            self.head = 0
+            self.n = 0
+            return  # Everything has expired
+        
+        idx = int(np.searchsorted(self.live_timestamps, cutoff, side="right"))
+        self.head += idx
+        self.n -= idx
+
+
+# Returns the stable id of an endpoint, assigning the next free one on
+# first sight so every worker and restart agrees on the encoding.
+# KEYS: [endpoint_ids_hash]
+# ARGV: [endpoint]
+ENDPOINT_ID_SCRIPT = """
+local endpoint_id = redis.call('HGET', KEYS[1], ARGV[1])
+if not endpoint_id then
+    endpoint_id = redis.call('HLEN', KEYS[1])
+    redis.call('HSET', KEYS[1], ARGV[1], endpoint_id)
+end
+return tonumber(endpoint_id)
+"""
+
+# Unlinks every window key tracked for a client, then the tracking set.
+# UNLINK frees memory in a background thread so resets don't stall Redis.
+# KEYS: [client_windows_key]
+RESET_CLIENT_SCRIPT = """
+local keys = redis.call('ZRANGE', KEYS[1], 0, -1)
+for _, key in ipairs(keys) do
+    redis.call('UNLINK', key)
+end
+redis.call('UNLINK', KEYS[1])
+return #keys
+"""
+
 class IntelligentRateLimiter:
     """
     ML-powered rate limiter that adapts to traffic patterns
@@ -23,10 +242,17 @@ class IntelligentRateLimiter:
         base_limit: int = 100,
         window_seconds: int = 60,
         anomaly_threshold: float = -0.5,
-        training_interval_minutes: int = 5
+        training_interval_minutes: int = 5,
+        max_connections: int = 64
     ):
         self.redis_url = redis_url
+        self.max_connections = max_connections
+        self.redis_pool: Optional[redis.BlockingConnectionPool] = None
         self.redis_client: Optional[redis.Redis] = None
+        self.binary_client: Optional[redis.Redis] = None
+        self._check_script = None
+        self._endpoint_id_script = None
+        self._reset_client_script = None
         
         # Rate limiting configuration
         self.base_limit = base_limit
@@ -36,32 +262,92 @@ class IntelligentRateLimiter:
         
         # ML model
         self.model: Optional[IsolationForest] = None
+        self.model_trained = False
+        self.use_gpu = False
+        self._predictor = None
+        
+        # Anomaly scoring micro-batcher
+        self.score_batch_size = 64
+        self.score_batch_window = 0.001  # seconds
+        self._batch_X = np.empty((self.score_batch_size, 6), dtype=np.float32)
+        self._batch_futures: List[asyncio.Future] = []
+        self._batch_event: Optional[asyncio.Event] = None
+        self._scorer_task: Optional[asyncio.Task] = None
+        
+        # Traffic records waiting to be persisted to Redis
+        self._pending_writes: List[Tuple[str, str]] = []
+        self.flush_interval = 0.002  # seconds
+        self._flush_event: Optional[asyncio.Event] = None
+        self._flusher_task: Optional[asyncio.Task] = None
+        self._closing = False
+        
+        # Per-client concurrency limit
+        self.max_inflight_per_client = 8
+        self._client_semaphores: Dict[str, asyncio.Semaphore] = {}
+        
+        # Cached health probe
+        self.health_cache_seconds = 1.0
+        self._last_ping_ts = float("-inf")
+        self._last_ping_ok = False
         self.feature_scaler = {"mean": None, "std": None}
         
         # Traffic pattern tracking
-        self.traffic_buffer = defaultdict(list)
+        self.traffic_buffer: Dict[str, ClientRing] = defaultdict(
+            lambda: ClientRing(self.max_buffer_size)
+        )
         self.max_buffer_size = 1000
+        self._endpoint_ids: Dict[str, int] = {}
+        self._endpoint_names: List[Optional[str]] = []
+        
+        # Reservoir sample of raw feature rows used for training
+        self.max_training_samples = 10000
+        self._train_reservoir = np.empty((self.max_training_samples, 6), dtype=np.float32)
+        self._reservoir_size = 0
+        self._reservoir_seen = 0
         
         # Dynamic limits per endpoint
         self.endpoint_limits = {}
+        self._default_limits = (base_limit, self._get_dynamic_limit(None, True))
+        self._limit_table: Dict[str, Tuple[int, int]] = {}
         
     async def initialize(self):
         """Initialize Redis connection and load model if exists"""
         try:
-            self.redis_client = await redis.from_url(
+            # One bounded pool per worker; redis-py picks the hiredis
+            # parser automatically when it is installed
+            self.redis_pool = redis.BlockingConnectionPool.from_url(
                 self.redis_url,
+                max_connections=self.max_connections,
                 encoding="utf-8",
                 decode_responses=True
             )
+            self.redis_client = redis.Redis(connection_pool=self.redis_pool)
+            
+            # Separate client without response decoding for binary blobs
+            self.binary_client = redis.from_url(self.redis_url, max_connections=2)
             await self.redis_client.ping()
             logger.info("✅ Connected to Redis")
             
+            self._check_script = self.redis_client.register_script(CHECK_REQUEST_SCRIPT)
+            self._endpoint_id_script = self.redis_client.register_script(ENDPOINT_ID_SCRIPT)
+            self._reset_client_script = self.redis_client.register_script(RESET_CLIENT_SCRIPT)
+            self._build_limit_table()
+            await self._load_endpoint_ids()
+            
             # Try to load existing model
             await self._load_model()
             
             # Initialize model if not loaded
             if self.model is None:
                 self._initialize_model()
+            
+            _warm_kernels()
+            
+            # Start the anomaly scoring batcher
+            self._batch_event = asyncio.Event()
+            self._scorer_task = asyncio.create_task(self._score_batches())
+            self._flush_event = asyncio.Event()
+            self._flusher_task = asyncio.create_task(self._flush_writes_periodically())
                 
         except Exception as e:
             logger.error(f"❌ Failed to initialize: {e}")
@@ -69,26 +355,53 @@ class IntelligentRateLimiter:
     
     async def close(self):
         """Close Redis connection"""
+        if self._scorer_task:
+            # Resolve checks still waiting on a batch before the scorer goes
+            self._scorer_task.cancel()
+            self._scorer_task = None
+            self._score_pending()
+        if self._flusher_task:
+            # Let the flusher finish its current batch and exit rather than
+            # cancelling it mid-pipeline, then write whatever is left
+            self._closing = True
+            self._flush_event.set()
+            await self._flusher_task
+            self._flusher_task = None
+            await self._flush_writes()
         if self.redis_client:
             await self.redis_client.close()
+        if self.redis_pool:
+            await self.redis_pool.disconnect()
+        if self.binary_client:
+            await self.binary_client.close()
     
     def _initialize_model(self):
         """Initialize the Isolation Forest model"""
-        self.model = IsolationForest(
+        params = dict(
             contamination=0.1,  # Expected proportion of anomalies
             random_state=42,
-            n_estimators=100
+            n_estimators=100,
+            max_samples=256
         )
-        logger.info("🤖 Initialized ML model")
+        self.use_gpu = _gpu_available()
+        if self.use_gpu:
+            self.model = cuIsolationForest(output_type="numpy", **params)
+        else:
+            self.model = IsolationForest(n_jobs=-1, **params)
+        self.model_trained = False
+        logger.info(f"🤖 Initialized ML model ({'GPU' if self.use_gpu else 'CPU'})")
     
     async def _load_model(self):
         """Load model from Redis"""
         try:
-            model_data = await self.redis_client.get("ml_model")
+            model_data = await self.binary_client.get("ml_model")
             if model_data:
-                model_dict = pickle.loads(model_data.encode('latin1'))
+                model_dict = pickle.loads(model_data)
                 self.model = model_dict['model']
                 self.feature_scaler = model_dict['scaler']
+                self.model_trained = True
+                self.use_gpu = cuIsolationForest is not None and isinstance(self.model, cuIsolationForest)
+                self._compile_predictor()
                 logger.info("📥 Loaded existing ML model from Redis")
         except Exception as e:
             logger.warning(f"⚠️ Could not load model: {e}")
@@ -100,73 +413,76 @@ class IntelligentRateLimiter:
                 'model': self.model,
                 'scaler': self.feature_scaler
             }
-            model_data = pickle.dumps(model_dict).decode('latin1')
-            await self.redis_client.set("ml_model", model_data)
+            model_data = pickle.dumps(model_dict, protocol=pickle.HIGHEST_PROTOCOL)
+            await self.binary_client.set("ml_model", model_data)
             logger.info("💾 Saved ML model to Redis")
         except Exception as e:
             logger.error(f"❌ Failed to save model: {e}")
     
-    def _extract_features(self, client_id: str, endpoint: str, timestamp: float) -> np.ndarray:
-        """Extract features for anomaly detection"""
-        current_time = datetime.fromtimestamp(timestamp)
-        
-        features = [
-            current_time.hour,  # Hour of day
-            current_time.weekday(),  # Day of week
-            len(self.traffic_buffer.get(client_id, [])),  # Request count
-            hash(endpoint) % 100,  # Endpoint hash (simple encoding)
-        ]
-        
-        # Add request rate features
-        recent_requests = self.traffic_buffer.get(client_id, [])
-        if len(recent_requests) > 1:
-            time_diffs = np.diff([r['timestamp'] for r in recent_requests[-10:]])
-            features.append(np.mean(time_diffs) if len(time_diffs) > 0 else 0)
-            features.append(np.std(time_diffs) if len(time_diffs) > 0 else 0)
-        else:
-            features.extend([0, 0])
-        
-        return np.array(features).reshape(1, -1)
+    def _extract_features(self, client_id: str, out: np.ndarray) -> np.ndarray:
+        """Extract features for the client's latest request into the (1, 6) `out`"""
+        ring = self.traffic_buffer[client_id]
+        timestamps = ring.live_timestamps[-10:]
+        endpoint_ids = ring.live_endpoints[-10:]
+        counts = np.arange(len(ring) - len(timestamps) + 1, len(ring) + 1)
+        
+        _feat_kernel(timestamps, endpoint_ids, counts, len(timestamps) - 1, out)
+        return out
     
     def _normalize_features(self, features: np.ndarray) -> np.ndarray:
-        """Normalize features using stored scaler"""
-        if self.feature_scaler['mean'] is None:
-            return features
-        
-        return (features - self.feature_scaler['mean']) / (self.feature_scaler['std'] + 1e-8)
+        """Normalize features in place using stored scaler"""
+        if self.feature_scaler['mean'] is not None:
+            _normalize_kernel(features, self.feature_scaler['mean'], self.feature_scaler['std'])
+        return features
     
     async def check_request(self, client_id: str, endpoint: str) -> Tuple[bool, Dict]:
         """
         Check if request is allowed and detect anomalies
         Returns: (allowed, info_dict)
         """
+        # Cap how many checks a single client can have in flight
+        semaphore = self._client_semaphores.get(client_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_inflight_per_client)
+            self._client_semaphores[client_id] = semaphore
+        
+        async with semaphore:
+            return await self._check_request(client_id, endpoint)
+    
+    async def _check_request(self, client_id: str, endpoint: str) -> Tuple[bool, Dict]:
+        """Rate limit and anomaly check for one request"""
         current_time = time.time()
         
+        # Resolve the endpoint's stable id (one round-trip on first sight only)
+        endpoint_id = self._endpoint_ids.get(endpoint)
+        if endpoint_id is None:
+            endpoint_id = await self._register_endpoint(endpoint)
+        
         # Track request
-        await self._track_request(client_id, endpoint, current_time)
+        self._track_request(client_id, endpoint, endpoint_id, current_time)
         
         # Get current window key
         window_key = f"rate_limit:{client_id}:{endpoint}:{int(current_time // self.window_seconds)}"
         
-        # Increment counter
-        count = await self.redis_client.incr(window_key)
-        if count == 1:
-            await self.redis_client.expire(window_key, self.window_seconds * 2)
-        
         # Detect anomaly
-        is_anomalous = await self._detect_anomaly(client_id, endpoint, current_time)
-        
-        # Get dynamic limit
-        current_limit = await self._get_dynamic_limit(endpoint, is_anomalous)
-        
-        # Check if allowed
-        allowed = count <= current_limit
-        remaining = max(0, current_limit - count)
+        is_anomalous = await self._detect_anomaly(client_id)
+        
+        # Count and decide in one atomic round-trip
+        allowed, remaining, reset_in, count, current_limit = await self._check_script(
+            keys=[window_key, f"client_windows:{client_id}"],
+            args=[
+                int(is_anomalous),
+                self.window_seconds * 2,
+                *self._limit_table.get(endpoint, self._default_limits),
+                self.window_seconds,
+                int(current_time)
+            ]
+        )
         
         info = {
             "current_limit": current_limit,
             "remaining": remaining,
-            "reset_in": self.window_seconds - (int(current_time) % self.window_seconds),
+            "reset_in": reset_in,
             "is_anomalous": is_anomalous,
             "request_count": count
         }
@@ -175,48 +491,175 @@ class IntelligentRateLimiter:
         if is_anomalous:
             logger.warning(f"🚨 Anomalous traffic detected from {client_id} on {endpoint}")
         
-        return allowed, info
+        return bool(allowed), info
     
-    async def _track_request(self, client_id: str, endpoint: str, timestamp: float):
+    def _track_request(
+        self,
+        client_id: str,
+        endpoint: str,
+        endpoint_id: int,
+        timestamp: float
+    ):
         """Track request for ML training"""
-        request_data = {
-            "endpoint": endpoint,
-            "timestamp": timestamp,
-            "hour": datetime.fromtimestamp(timestamp).hour,
-            "weekday": datetime.fromtimestamp(timestamp).weekday()
-        }
+        # Ring buffer evicts the oldest entry once max_buffer_size is hit
+        self.traffic_buffer[client_id].append(timestamp, endpoint_id)
         
-        self.traffic_buffer[client_id].append(request_data)
+        # Reservoir-sample the request's features for training
+        slot = self._reservoir_slot()
+        if slot is not None:
+            self._extract_features(client_id, self._train_reservoir[slot:slot + 1])
         
-        # Limit buffer size
-        if len(self.traffic_buffer[client_id]) > self.max_buffer_size:
-            self.traffic_buffer[client_id] = self.traffic_buffer[client_id][-self.max_buffer_size:]
-        
-        # Also store in Redis for persistence
-        await self.redis_client.lpush(
+        # Queue for persistence; hour/weekday are derived at feature time
+        self._pending_writes.append((
             f"traffic:{client_id}",
-            json.dumps(request_data)
-        )
-        await self.redis_client.ltrim(f"traffic:{client_id}", 0, self.max_buffer_size - 1)
-        await self.redis_client.expire(f"traffic:{client_id}", 86400)  # 24 hours
+            json.dumps({"endpoint": endpoint, "timestamp": timestamp})
+        ))
+        self._flush_event.set()
+    
+    async def _flush_writes(self):
+        """Persist queued traffic records to Redis in one pipeline"""
+        if not self._pending_writes:
+            return
+        pending, self._pending_writes = self._pending_writes, []
+        
+        by_key = defaultdict(list)
+        for key, record in pending:
+            by_key[key].append(record)
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key, records in by_key.items():
+            pipe.lpush(key, *records)
+            pipe.ltrim(key, 0, self.max_buffer_size - 1)
+            pipe.expire(key, 86400, nx=True)  # 24 hours from creation
+        await pipe.execute()
+    
+    async def _flush_writes_periodically(self):
+        """Background task flushing queued traffic records"""
+        while not self._closing:
+            await self._flush_event.wait()
+            
+            # Give concurrent requests a moment to join the batch
+            await asyncio.sleep(self.flush_interval)
+            self._flush_event.clear()
+            try:
+                await self._flush_writes()
+            except Exception as e:
+                logger.error(f"❌ Failed to persist traffic: {e}")
+    
+    def _reservoir_slot(self) -> Optional[int]:
+        """Pick the reservoir row for a new sample, or None to skip it"""
+        if self._reservoir_size < self.max_training_samples:
+            self._reservoir_size += 1
+            return self._reservoir_size - 1
+        
+        # Capping the seen count keeps replacements flowing so the
+        # sample keeps tracking recent traffic
+        self._reservoir_seen = min(self._reservoir_seen + 1, 4 * self.max_training_samples)
+        slot = random.randrange(self.max_training_samples + self._reservoir_seen)
+        return slot if slot < self.max_training_samples else None
+    
+    def _remember_endpoint(self, endpoint: str, endpoint_id: int):
+        """Cache an endpoint id locally"""
+        self._endpoint_ids[endpoint] = endpoint_id
+        if endpoint_id >= len(self._endpoint_names):
+            self._endpoint_names.extend([None] * (endpoint_id + 1 - len(self._endpoint_names)))
+        self._endpoint_names[endpoint_id] = endpoint
     
-    async def _detect_anomaly(self, client_id: str, endpoint: str, timestamp: float) -> bool:
+    async def _register_endpoint(self, endpoint: str) -> int:
+        """Get or assign the persistent id for a new endpoint"""
+        endpoint_id = await self._endpoint_id_script(keys=["endpoint_ids"], args=[endpoint])
+        self._remember_endpoint(endpoint, endpoint_id)
+        return endpoint_id
+    
+    async def _load_endpoint_ids(self):
+        """Load the persistent endpoint id table from Redis"""
+        endpoint_ids = await self.redis_client.hgetall("endpoint_ids")
+        for endpoint, endpoint_id in endpoint_ids.items():
+            self._remember_endpoint(endpoint, int(endpoint_id))
+    
+    async def _detect_anomaly(self, client_id: str) -> bool:
         """Detect if current request is anomalous"""
-        if self.model is None or not hasattr(self.model, 'estimators_'):
+        if not self.model_trained:
             return False
         
+        # Flush a full batch inline so its rows can be reused
+        if len(self._batch_futures) == self.score_batch_size:
+            self._score_pending()
+        
+        # Features are written straight into the next row of the batch
+        row = len(self._batch_futures)
         try:
-            features = self._extract_features(client_id, endpoint, timestamp)
-            features_normalized = self._normalize_features(features)
-            
-            score = self.model.score_samples(features_normalized)[0]
-            return score < self.anomaly_threshold
-            
+            features = self._extract_features(client_id, self._batch_X[row:row + 1])
+            self._normalize_features(features)
         except Exception as e:
             logger.error(f"❌ Error detecting anomaly: {e}")
             return False
+        
+        # Scored together with other in-flight requests by _score_batches
+        future = asyncio.get_running_loop().create_future()
+        self._batch_futures.append(future)
+        if self._scorer_task is None:
+            self._score_pending()  # Shutting down: no batcher to wait for
+        else:
+            self._batch_event.set()
+        return await future
+    
+    def _score_pending(self):
+        """Score all pending feature rows at once and resolve their futures"""
+        futures, self._batch_futures = self._batch_futures, []
+        if not futures:
+            return
+        
+        try:
+            scores = self._score_samples(self._batch_X[:len(futures)])
+            results = [bool(score < self.anomaly_threshold) for score in scores]
+        except Exception as e:
+            logger.error(f"❌ Error detecting anomaly: {e}")
+            results = [False] * len(futures)
+        
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+    
+    def _score_samples(self, X: np.ndarray) -> np.ndarray:
+        """Anomaly scores (sklearn's score_samples convention) for rows of X"""
+        if self._predictor is not None:
+            # Treelite yields the positive anomaly score; sklearn negates it
+            return -treelite.gtil.predict(self._predictor, X).ravel()
+        
+        return self.model.score_samples(X)
+    
+    def _compile_predictor(self):
+        """Compile the fitted sklearn model with Treelite, if available"""
+        self._predictor = None
+        if treelite is None or self.use_gpu:
+            return
+        
+        try:
+            predictor = treelite.sklearn.import_model(self.model)
+            
+            # Only switch over if the compiled scores match sklearn's
+            probe = np.random.default_rng(0).standard_normal((16, 6)).astype(np.float32)
+            compiled = -treelite.gtil.predict(predictor, probe).ravel()
+            if np.allclose(compiled, self.model.score_samples(probe), atol=1e-5):
+                self._predictor = predictor
+                logger.info("⚡ Compiled ML model with Treelite")
+            else:
+                logger.warning("⚠️ Treelite scores differ from sklearn; using sklearn")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not compile model with Treelite: {e}")
+    
+    async def _score_batches(self):
+        """Background task scoring pending feature rows in batches"""
+        while True:
+            await self._batch_event.wait()
+            
+            # Give concurrent requests a moment to join the batch
+            await asyncio.sleep(self.score_batch_window)
+            self._batch_event.clear()
+            self._score_pending()
     
-    async def _get_dynamic_limit(self, endpoint: str, is_anomalous: bool) -> int:
+    def _get_dynamic_limit(self, endpoint: Optional[str], is_anomalous: bool) -> int:
         """Get dynamic rate limit based on endpoint and anomaly status"""
         # Base limit for endpoint
         base = self.endpoint_limits.get(endpoint, self.base_limit)
@@ -227,45 +670,54 @@ class IntelligentRateLimiter:
         
         return base
     
+    def _build_limit_table(self):
+        """
+        Precompute (base, anomalous) limits per endpoint for the check
+        script. Call again whenever `base_limit` or `endpoint_limits` change.
+        """
+        self._default_limits = (self.base_limit, self._get_dynamic_limit(None, True))
+        self._limit_table = {
+            endpoint: (
+                self._get_dynamic_limit(endpoint, False),
+                self._get_dynamic_limit(endpoint, True)
+            )
+            for endpoint in self.endpoint_limits
+        }
+    
     async def train_model(self):
         """Train the ML model on collected traffic data"""
         logger.info("🎓 Starting model training...")
         
         try:
             # Collect training data
-            all_features = []
-            
-            for client_id, requests in self.traffic_buffer.items():
-                for req in requests:
-                    features = self._extract_features(
-                        client_id,
-                        req['endpoint'],
-                        req['timestamp']
-                    )
-                    all_features.append(features[0])
+            n_samples = self._reservoir_size
             
-            if len(all_features) < 50:
+            if n_samples < 50:
                 logger.warning("⚠️ Not enough data for training (need at least 50 samples)")
                 return
             
-            X = np.array(all_features)
+            X = self._train_reservoir[:n_samples].copy()
             
             # Calculate scaler
             self.feature_scaler = {
-                'mean': np.mean(X, axis=0),
-                'std': np.std(X, axis=0)
+                'mean': np.mean(X, axis=0, dtype=np.float64),
+                'std': np.std(X, axis=0, dtype=np.float64)
             }
             
             # Normalize
             X_normalized = self._normalize_features(X)
             
             # Train model
+            if self.use_gpu:
+                X_normalized = cupy.asarray(X_normalized)
             self.model.fit(X_normalized)
+            self.model_trained = True
+            self._compile_predictor()
             
             # Save model
             await self._save_model()
             
-            logger.info(f"✅ Model trained on {len(all_features)} samples")
+            logger.info(f"✅ Model trained on {n_samples} samples")
             
         except Exception as e:
             logger.error(f"❌ Training failed: {e}")
@@ -290,14 +742,17 @@ class IntelligentRateLimiter:
                 cutoff = current_time - 86400  # 24 hours
                 
                 for client_id in list(self.traffic_buffer.keys()):
-                    self.traffic_buffer[client_id] = [
-                        r for r in self.traffic_buffer[client_id]
-                        if r['timestamp'] > cutoff
-                    ]
+                    ring = self.traffic_buffer[client_id]
+                    ring.drop_until(cutoff)
                     
-                    if not self.traffic_buffer[client_id]:
+                    if not ring:
                         del self.traffic_buffer[client_id]
                 
+                # Forget the semaphores of clients that have gone idle
+                for client_id in list(self._client_semaphores.keys()):
+                    if client_id not in self.traffic_buffer:
+                        del self._client_semaphores[client_id]
+                
                 logger.info("🧹 Cleaned up old traffic data")
                 
             except Exception as e:
@@ -305,21 +760,25 @@ class IntelligentRateLimiter:
     
     async def get_traffic_stats(self) -> Dict:
         """Get current traffic statistics"""
-        total_requests = sum(len(reqs) for reqs in self.traffic_buffer.values())
+        total_requests = sum(len(ring) for ring in self.traffic_buffer.values())
         unique_clients = len(self.traffic_buffer)
         
         # Get endpoint distribution
-        endpoint_counts = defaultdict(int)
-        for requests in self.traffic_buffer.values():
-            for req in requests:
-                endpoint_counts[req['endpoint']] += 1
+        endpoint_counts = np.zeros(len(self._endpoint_names), dtype=np.int64)
+        for ring in self.traffic_buffer.values():
+            endpoint_counts += np.bincount(
+                ring.live_endpoints, minlength=len(self._endpoint_names)
+            )
         
         return {
             "total_requests": total_requests,
             "unique_clients": unique_clients,
-            "endpoints": dict(endpoint_counts),
-            "model_trained": self.model is not None and hasattr(self.model, 'estimators_'),
-            "buffer_size": {client: len(reqs) for client, reqs in self.traffic_buffer.items()}
+            "endpoints": {
+                self._endpoint_names[endpoint_id]: int(count)
+                for endpoint_id, count in enumerate(endpoint_counts) if count
+            },
+            "model_trained": self.model_trained,
+            "buffer_size": {client: len(ring) for client, ring in self.traffic_buffer.items()}
         }
     
     async def get_current_limits(self) -> Dict:
@@ -332,17 +791,20 @@ class IntelligentRateLimiter:
     
     async def get_client_info(self, client_id: str) -> Dict:
         """Get information about a specific client"""
-        requests = self.traffic_buffer.get(client_id, [])
+        ring = self.traffic_buffer.get(client_id)
         
-        if not requests:
+        if not ring:
             return {"error": "Client not found"}
         
+        timestamps = ring.live_timestamps
         return {
             "client_id": client_id,
-            "total_requests": len(requests),
-            "first_seen": min(r['timestamp'] for r in requests),
-            "last_seen": max(r['timestamp'] for r in requests),
-            "endpoints_accessed": list(set(r['endpoint'] for r in requests))
+            "total_requests": len(ring),
+            "first_seen": float(timestamps.min()),
+            "last_seen": float(timestamps.max()),
+            "endpoints_accessed": [
+                self._endpoint_names[endpoint_id] for endpoint_id in np.unique(ring.live_endpoints)
+            ]
         }
     
     async def reset_client(self, client_id: str):
@@ -352,37 +814,35 @@ class IntelligentRateLimiter:
             del self.traffic_buffer[client_id]
         
         # Clear from Redis
-        pattern = f"rate_limit:{client_id}:*"
-        cursor = 0
-        while True:
-            cursor, keys = await self.redis_client.scan(cursor, match=pattern, count=100)
-            if keys:
-                await self.redis_client.delete(*keys)
-            if cursor == 0:
-                break
+        await self._reset_client_script(keys=[f"client_windows:{client_id}"])
     
     async def get_model_info(self) -> Dict:
         """Get ML model information"""
         if self.model is None:
             return {"status": "not_initialized"}
         
-        is_trained = hasattr(self.model, 'estimators_')
-        
         return {
-            "status": "trained" if is_trained else "initialized",
+            "status": "trained" if self.model_trained else "initialized",
             "contamination": self.model.contamination,
             "n_estimators": self.model.n_estimators,
             "anomaly_threshold": self.anomaly_threshold,
-            "features": ["hour", "weekday", "request_count", "endpoint_hash", "mean_interval", "std_interval"]
+            "features": ["hour", "weekday", "request_count", "endpoint_id", "mean_interval", "std_interval"]
         }
     
     async def check_redis_connection(self) -> bool:
-        """Check if Redis is connected"""
+        """Check if Redis is connected (cached for `health_cache_seconds`)"""
+        now = time.monotonic()
+        if now - self._last_ping_ts < self.health_cache_seconds:
+            return self._last_ping_ok
+        
         try:
             await self.redis_client.ping()
-            return True
-        except:
-            return False
+            self._last_ping_ok = True
+        except redis.RedisError:
+            self._last_ping_ok = False
+        
+        self._last_ping_ts = now
+        return self._last_ping_ok
 
 
 import time
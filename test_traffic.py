@@ -3,162 +3,337 @@ Test script to demonstrate the Intelligent Rate Limiter
 Simulates normal and anomalous traffic patterns
 """
 
+import argparse
 import asyncio
 import aiohttp
+import collections
+import functools
+import logging
+import logging.handlers
+import queue
+import os
 import random
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import sys
+from typing import Optional
+
+# uvloop (shipped with uvicorn[standard]) cuts per-request loop overhead
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
+# orjson decodes the admin payloads in C; stdlib json also accepts bytes
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# httpx[http2] is only needed for the optional --http2 backend
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+_REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+if httpx is not None:
+    _REQUEST_ERRORS += (httpx.HTTPError,)
+
+logger = logging.getLogger("traffic")
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# TaskGroup (3.11+) tracks tasks without a side list and cancels cleanly
+_HAS_TASKGROUP = sys.version_info >= (3, 11)
 
 BASE_URL = "http://localhost:8000"
+ENDPOINTS = ("/", "/api/data", "/api/process", "/api/heavy-operation")
+USER_NAMES = tuple(f"user_{i}" for i in range(1, 11))
+_BAR = "=" * 60
+
+
+@functools.lru_cache(maxsize=32)
+def client_headers(client_name: str) -> dict:
+    """Shared per-client request headers (do not mutate)"""
+    return {"X-Forwarded-For": client_name}
+
+
+def setup_logging(level: int = logging.INFO, prefix: str = "") -> logging.handlers.QueueListener:
+    """
+    Route per-request log lines through a queue so the event loop never
+    blocks on terminal writes; a background listener does the printing.
+    `prefix` is prepended to every line (e.g. to tell worker processes apart).
+    """
+    global _listener
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(prefix + "%(message)s"))
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    _listener.start()
+    return _listener
+
+
+def flush_logs():
+    """Block until every queued log line has been written (call before printing)"""
+    if _listener is not None:
+        # stop() drains the queue and joins the writer thread
+        _listener.stop()
+        _listener.start()
+
+
+class AIMDPacer:
+    """
+    Rate pacer that speeds up while requests succeed and halves on 429s,
+    so continuous load tracks what the limiter actually allows
+    """
+    
+    def __init__(self, rate: float = 1.0, min_rate: float = 0.2, max_rate: float = 20.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.statuses = collections.deque(maxlen=128)
+    
+    def record(self, status):
+        """Adjust the rate from a response status"""
+        self.statuses.append(status)
+        if status == 200:
+            self.rate = min(self.rate * 1.05, self.max_rate)
+        elif status == 429:
+            self.rate = max(self.rate * 0.5, self.min_rate)
+    
+    def delay(self, jitter: float = 0.0) -> float:
+        """Seconds to wait before the next request"""
+        return max(0.0, 1.0 / self.rate - jitter)
+    
+    @property
+    def success_rate(self) -> float:
+        """Share of 200s over the recent status window"""
+        if not self.statuses:
+            return 0.0
+        return self.statuses.count(200) / len(self.statuses)
+
 
 class TrafficSimulator:
-    def __init__(self, base_url: str = BASE_URL):
+    def __init__(self, base_url: str = BASE_URL, http2: bool = False):
         self.base_url = base_url
+        self.http2 = http2
         self.session = None
+        self.client = None
+        self._urls = {endpoint: base_url + endpoint for endpoint in ENDPOINTS}
+        self._consec_fail = 0
         
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        # Explicit cap on in-flight requests (backpressure for all phases)
+        self.sem = asyncio.Semaphore(64)
+        
+        if self.http2:
+            if httpx is None:
+                raise RuntimeError("--http2 requires httpx: pip install 'httpx[http2]'")
+            # One multiplexed connection carries the bursts when the server
+            # negotiates h2 (TLS/ALPN); otherwise httpx falls back to HTTP/1.1
+            self.client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=256, max_keepalive_connections=128),
+                timeout=10
+            )
+            return self
+        
+        # Raise the default 100-connection cap and keep connections (and
+        # DNS lookups) around so bursts reuse sockets instead of queuing
+        connector = aiohttp.TCPConnector(
+            limit=512,
+            limit_per_host=256,
+            keepalive_timeout=30,
+            ttl_dns_cache=300,
+            enable_cleanup_closed=True
+        )
+        # The API never compresses its small JSON bodies, so don't advertise
+        # gzip or pay for the decompression path (or a User-Agent header)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=10),
+            auto_decompress=False,
+            skip_auto_headers=("Accept-Encoding", "User-Agent"),
+            raise_for_status=False
+        )
         return self
     
     async def __aexit__(self, *args):
-        await self.session.close()
+        if self.client is not None:
+            await self.client.aclose()
+        else:
+            await self.session.close()
     
     async def make_request(self, endpoint: str, client_name: str = "normal"):
         """Make a single request"""
+        url = self._urls.get(endpoint) or self.base_url + endpoint
         try:
-            async with self.session.get(
-                f"{self.base_url}{endpoint}",
-                headers={"X-Forwarded-For": client_name}
-            ) as response:
-                status = response.status
-                headers = dict(response.headers)
-                
+            if self.client is not None:
+                async with self.sem:
+                    response = await self.client.get(url, headers=client_headers(client_name))
+                status = response.status_code
+                headers = response.headers
+            else:
+                async with self.sem, self.session.get(url, headers=client_headers(client_name)) as response:
+                    status = response.status
+                    headers = response.headers
+                    # Body is never used: hand the connection back to the pool now
+                    await response.release()
+            
+            # Skip the header lookups when the line wouldn't be logged
+            if logger.isEnabledFor(logging.INFO):
                 limit = headers.get('X-RateLimit-Limit', 'N/A')
                 remaining = headers.get('X-RateLimit-Remaining', 'N/A')
                 
                 if status == 200:
-                    print(f"✅ [{client_name}] {endpoint} - Limit: {limit}, Remaining: {remaining}")
+                    logger.info("✅ [%s] %s - Limit: %s, Remaining: %s", client_name, endpoint, limit, remaining)
                 elif status == 429:
-                    print(f"🚫 [{client_name}] {endpoint} - RATE LIMITED! (Limit: {limit})")
-                    
-                return status, headers
+                    logger.info("🚫 [%s] %s - RATE LIMITED! (Limit: %s)", client_name, endpoint, limit)
                 
-        except Exception as e:
-            print(f"❌ Error: {e}")
+            self._consec_fail = 0
+            return status, headers
+                
+        except _REQUEST_ERRORS as e:
+            logger.error("❌ Error: %s", e)
+            # Circuit breaker: back off instead of hammering a server that's down
+            self._consec_fail += 1
+            if self._consec_fail > 10:
+                await asyncio.sleep(min(30, 2 ** (self._consec_fail - 10)))
             return None, {}
     
     async def simulate_normal_traffic(self, duration: int = 30):
         """Simulate normal traffic pattern"""
-        print(f"\n{'='*60}")
-        print("🟢 Simulating NORMAL traffic pattern...")
-        print(f"{'='*60}\n")
+        print(f"\n{_BAR}\n🟢 Simulating NORMAL traffic pattern...\n{_BAR}\n")
         
         endpoints = ["/", "/api/data", "/api/process"]
         
-        for i in range(duration):
-            endpoint = random.choice(endpoints)
-            await self.make_request(endpoint, "normal_user")
-            await asyncio.sleep(random.uniform(0.5, 1.5))
+        # Draw the whole schedule up front to keep RNG off the request path
+        schedule = random.choices(endpoints, k=duration)
+        delays = [random.uniform(0.5, 1.5) for _ in range(duration)]
+        
+        # Fire on a timer and let requests complete concurrently so the
+        # arrival rate holds even when server latency rises (in-flight is
+        # still capped by self.sem)
+        tasks = []
+        for endpoint, delay in zip(schedule, delays):
+            tasks.append(asyncio.create_task(self.make_request(endpoint, "normal_user")))
+            await asyncio.sleep(delay)
+        
+        await asyncio.gather(*tasks)
         
+        flush_logs()
         print(f"\n✅ Normal traffic simulation completed\n")
     
     async def simulate_anomalous_traffic(self, duration: int = 20):
         """Simulate anomalous traffic (potential DDoS)"""
-        print(f"\n{'='*60}")
-        print("🔴 Simulating ANOMALOUS traffic pattern (rapid requests)...")
-        print(f"{'='*60}\n")
+        print(f"\n{_BAR}\n🔴 Simulating ANOMALOUS traffic pattern (rapid requests)...\n{_BAR}\n")
         
         endpoint = "/api/heavy-operation"
         
-        tasks = []
-        for i in range(duration):
-            # Rapid fire requests
-            for _ in range(5):
-                task = self.make_request(endpoint, "suspicious_user")
-                tasks.append(task)
-            
-            if len(tasks) >= 10:
-                await asyncio.gather(*tasks)
-                tasks = []
-            
-            await asyncio.sleep(0.1)
+        # Rapid fire requests: submit the whole batch at once and let the
+        # semaphore, not sleeps between mini-batches, bound what is in flight
+        sem = asyncio.Semaphore(16)
         
-        if tasks:
-            await asyncio.gather(*tasks)
+        async def one():
+            async with sem:
+                await self.make_request(endpoint, "suspicious_user")
         
+        if _HAS_TASKGROUP:
+            async with asyncio.TaskGroup() as tg:
+                for _ in range(duration * 5):
+                    tg.create_task(one())
+        else:
+            await asyncio.gather(*(one() for _ in range(duration * 5)))
+        
+        flush_logs()
         print(f"\n✅ Anomalous traffic simulation completed\n")
     
     async def simulate_burst_traffic(self):
         """Simulate sudden burst of traffic"""
-        print(f"\n{'='*60}")
-        print("🟡 Simulating BURST traffic pattern...")
-        print(f"{'='*60}\n")
+        print(f"\n{_BAR}\n🟡 Simulating BURST traffic pattern...\n{_BAR}\n")
         
         # Sudden burst
-        tasks = []
-        for i in range(50):
-            task = self.make_request("/api/data", f"burst_user_{i%5}")
-            tasks.append(task)
-        
-        await asyncio.gather(*tasks)
+        if _HAS_TASKGROUP:
+            async with asyncio.TaskGroup() as tg:
+                for i in range(50):
+                    tg.create_task(self.make_request("/api/data", f"burst_user_{i%5}"))
+        else:
+            tasks = []
+            for i in range(50):
+                task = self.make_request("/api/data", f"burst_user_{i%5}")
+                tasks.append(task)
+            
+            await asyncio.gather(*tasks)
         
+        flush_logs()
         print(f"\n✅ Burst traffic simulation completed\n")
     
+    async def _get_json(self, path: str):
+        """GET an admin endpoint and decode it, or None on a non-200"""
+        url = self.base_url + path
+        if self.client is not None:
+            response = await self.client.get(url)
+            return json_loads(response.content) if response.status_code == 200 else None
+        
+        async with self.session.get(url) as response:
+            if response.status == 200:
+                return json_loads(await response.read())
+        return None
+    
     async def check_stats(self):
         """Check current system statistics"""
-        print(f"\n{'='*60}")
-        print("📊 Current System Statistics")
-        print(f"{'='*60}\n")
+        # Collect output and print once so concurrent checks don't interleave
+        out = [f"\n{_BAR}\n📊 Current System Statistics\n{_BAR}\n"]
         
         try:
-            async with self.session.get(f"{self.base_url}/admin/stats") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    print(f"Total Requests: {data['total_requests']}")
-                    print(f"Unique Clients: {data['unique_clients']}")
-                    print(f"Model Trained: {data['model_trained']}")
-                    print(f"\nEndpoint Distribution:")
-                    for endpoint, count in data['endpoints'].items():
-                        print(f"  {endpoint}: {count}")
+            data = await self._get_json("/admin/stats")
+            if data is not None:
+                out.append(f"Total Requests: {data['total_requests']}")
+                out.append(f"Unique Clients: {data['unique_clients']}")
+                out.append(f"Model Trained: {data['model_trained']}")
+                out.append(f"\nEndpoint Distribution:")
+                for endpoint, count in data['endpoints'].items():
+                    out.append(f"  {endpoint}: {count}")
         except Exception as e:
-            print(f"❌ Error fetching stats: {e}")
+            out.append(f"❌ Error fetching stats: {e}")
         
-        print()
+        out.append("")
+        flush_logs()
+        print("\n".join(out))
     
     async def check_model_info(self):
         """Check ML model information"""
-        print(f"\n{'='*60}")
-        print("🤖 ML Model Information")
-        print(f"{'='*60}\n")
+        out = [f"\n{_BAR}\n🤖 ML Model Information\n{_BAR}\n"]
         
         try:
-            async with self.session.get(f"{self.base_url}/admin/model-info") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    print(f"Status: {data['status']}")
-                    if data['status'] != 'not_initialized':
-                        print(f"Anomaly Detection Threshold: {data.get('anomaly_threshold', 'N/A')}")
-                        print(f"Features Used: {', '.join(data.get('features', []))}")
+            data = await self._get_json("/admin/model-info")
+            if data is not None:
+                out.append(f"Status: {data['status']}")
+                if data['status'] != 'not_initialized':
+                    out.append(f"Anomaly Detection Threshold: {data.get('anomaly_threshold', 'N/A')}")
+                    out.append(f"Features Used: {', '.join(data.get('features', []))}")
         except Exception as e:
-            print(f"❌ Error fetching model info: {e}")
+            out.append(f"❌ Error fetching model info: {e}")
         
-        print()
+        out.append("")
+        flush_logs()
+        print("\n".join(out))
 
 
-async def run_demo():
+async def run_demo(http2: bool = False):
     """Run complete demonstration"""
-    print("\n" + "="*60)
-    print("🚀 Intelligent Rate Limiter - Demo Script")
-    print("="*60 + "\n")
+    print(f"\n{_BAR}\n🚀 Intelligent Rate Limiter - Demo Script\n{_BAR}\n")
     
     # Wait for server to be ready
     print("⏳ Waiting for server to be ready...")
     await asyncio.sleep(2)
     
-    async with TrafficSimulator() as sim:
-        # Check initial state
-        await sim.check_stats()
-        await sim.check_model_info()
+    async with TrafficSimulator(http2=http2) as sim:
+        # Check initial state (independent GETs, issued concurrently)
+        await asyncio.gather(sim.check_stats(), sim.check_model_info())
         
         # Phase 1: Normal traffic
         await sim.simulate_normal_traffic(duration=20)
@@ -181,48 +356,100 @@ async def run_demo():
         await sim.check_stats()
         
         # Final statistics
-        print("\n" + "="*60)
-        print("📈 FINAL STATISTICS")
-        print("="*60)
-        await sim.check_stats()
-        await sim.check_model_info()
+        print(f"\n{_BAR}\n📈 FINAL STATISTICS\n{_BAR}")
+        await asyncio.gather(sim.check_stats(), sim.check_model_info())
         
-        print("\n" + "="*60)
-        print("✅ Demo completed!")
-        print("="*60 + "\n")
+        print(f"\n{_BAR}\n✅ Demo completed!\n{_BAR}\n")
         print("💡 The system has now learned from the traffic patterns.")
         print("   Subsequent anomalous traffic will be rate-limited more aggressively.\n")
 
 
-async def run_continuous_test():
+async def run_continuous_test(http2: bool = False):
     """Run continuous test to build up training data"""
     print("\n🔄 Running continuous test to build ML training data...")
     print("   Press Ctrl+C to stop\n")
     
-    async with TrafficSimulator() as sim:
+    # Normal traffic is paced by the limiter's responses instead of fixed sleeps
+    pacer = AIMDPacer()
+    
+    async with TrafficSimulator(http2=http2) as sim:
         try:
             while True:
-                # Mix of normal and occasional anomalous traffic
-                if random.random() < 0.8:
-                    await sim.make_request(
-                        random.choice(["/", "/api/data", "/api/process"]),
-                        f"user_{random.randint(1, 10)}"
-                    )
-                    await asyncio.sleep(random.uniform(0.3, 2.0))
-                else:
-                    # Anomalous burst
-                    for _ in range(random.randint(5, 15)):
-                        await sim.make_request("/api/heavy-operation", "attacker")
-                        await asyncio.sleep(0.05)
-                    await asyncio.sleep(random.uniform(5, 10))
+                # Pre-generate decisions in chunks rather than per iteration
+                decisions = random.choices(("normal", "attack"), weights=(0.8, 0.2), k=1000)
+                endpoints = random.choices(["/", "/api/data", "/api/process"], k=1000)
+                users = random.choices(USER_NAMES, k=1000)
+                jitters = [random.uniform(0, 0.1) for _ in range(1000)]
+                
+                for decision, endpoint, user, jitter in zip(decisions, endpoints, users, jitters):
+                    # Mix of normal and occasional anomalous traffic
+                    if decision == "normal":
+                        status, _ = await sim.make_request(endpoint, user)
+                        pacer.record(status)
+                        await asyncio.sleep(pacer.delay(jitter))
+                    else:
+                        # Anomalous burst
+                        for _ in range(random.randint(5, 15)):
+                            await sim.make_request("/api/heavy-operation", "attacker")
+                            await asyncio.sleep(0.05)
+                        await asyncio.sleep(random.uniform(5, 10))
                     
-        except KeyboardInterrupt:
+        # asyncio.run() turns Ctrl+C into a cancellation of this task
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            flush_logs()
             print("\n\n⏹️  Stopping continuous test...")
+            print(f"   Pacer rate: {pacer.rate:.2f} req/s, recent success: {pacer.success_rate:.0%}")
             await sim.check_stats()
+            raise
+
+
+def _continuous_worker(worker_id: int, http2: bool = False):
+    """Run one continuous-test event loop in its own process"""
+    listener = setup_logging(prefix=f"[worker {worker_id}] ")
+    try:
+        asyncio.run(run_continuous_test(http2))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.stop()
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1 and sys.argv[1] == "continuous":
-        asyncio.run(run_continuous_test())
+    parser = argparse.ArgumentParser(description="Traffic simulator for the Intelligent Rate Limiter")
+    parser.add_argument("mode", nargs="?", choices=("demo", "continuous"), default="demo")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="processes for continuous mode only, one event loop each (0 = one per CPU)"
+    )
+    parser.add_argument(
+        "--http2", action="store_true",
+        help="use httpx with HTTP/2 instead of aiohttp (needs httpx[http2]; "
+             "h2 is only negotiated over TLS, plain http:// stays on HTTP/1.1)"
+    )
+    args = parser.parse_args()
+    if args.workers < 0:
+        parser.error("--workers must be 0 or more")
+    if args.mode != "continuous" and args.workers != 1:
+        parser.error("--workers only applies to continuous mode")
+    
+    workers = args.workers or os.cpu_count() or 1
+    if args.mode == "continuous" and workers > 1:
+        # A single loop saturates a core on scheduling/parsing long before
+        # the server does, so fan out one loop per process. Ctrl+C reaches
+        # every worker in the process group, so just let them wind down
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_continuous_worker, range(workers), [args.http2] * workers))
+        except KeyboardInterrupt:
+            pass
     else:
-        asyncio.run(run_demo())
+        listener = setup_logging()
+        try:
+            if args.mode == "continuous":
+                asyncio.run(run_continuous_test(args.http2))
+            else:
+                asyncio.run(run_demo(args.http2))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.stop()